@@ -1,15 +1,65 @@
+import json
+import os
+import tempfile
+import warnings
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import suppress
+from pathlib import Path
 
 import antares_client
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 from antares_client.search import get_by_ztf_object_id
 from nested_pandas import NestedFrame
 from tqdm import tqdm
 
-pd.set_option("future.no_silent_downcasting", True)
+from ..utils import band_dtype
 
+pd.set_option("future.no_silent_downcasting", True)
 
-def format_antares_lc(locus: antares_client.search.Locus) -> pd.DataFrame:
+_BAND_MAP = {"g": "ztfg", "G": "ztfg", "r": "ztfr", "R": "ztfr", "i": "ztfi", "I": "ztfi"}
+_BAND_CODES = {passband: band_dtype.categories.get_loc(band) for passband, band in _BAND_MAP.items()}
+
+# Every per-locus batch shares this schema (and band dictionary) so they concatenate without casting.
+# After ztf_object_id (which becomes the index), the columns run small-to-large: this is the order of
+# the nested lightcurve layer, so the bool and dictionary columns sit next to each other in every row
+# group and a reader fetching only those issues a single range request.
+_BAND_DICTIONARY = pa.array(band_dtype.categories, type=pa.string())
+_LC_SCHEMA = pa.schema(
+    [
+        ("ztf_object_id", pa.string()),
+        ("non_detection", pa.bool_()),
+        ("band", pa.dictionary(pa.int8(), pa.string())),
+        ("magnitude_error", pa.float32()),
+        ("magnitude", pa.float32()),
+        ("mjd", pa.float64()),
+    ]
+)
+# Returned for loci without any photometry yet; record batches are immutable, so it can be shared
+_EMPTY_LC = pa.RecordBatch.from_pylist([], schema=_LC_SCHEMA)
+
+# Passed through NestedFrame.to_parquet to pyarrow.parquet.write_table. Dictionary encoding is
+# left at pyarrow's default (all columns), which already covers the low-cardinality band column.
+# The single-file output and the base layer hold one row per object, so row groups are sized in
+# objects; the flat lightcurve layer holds one row per observation and uses its own, larger size.
+_PARQUET_WRITE_OPTIONS = {
+    "compression": "zstd",
+    "compression_level": 3,
+    "row_group_size": 64,
+    "data_page_size": 1 << 20,
+    "write_statistics": True,
+}
+_LC_LAYER_ROW_GROUP_SIZE = 1 << 16
+
+# Formatted loci are cached on disk by ZTF ID. Bump the version whenever the
+# lightcurve schema or metadata layout changes so stale entries are ignored.
+_CACHE_DIR = Path("~/.cache/refitt_pipeline/antares").expanduser()
+_CACHE_VERSION = "3"
+_cache_warning_issued = False
+
+
+def format_antares_lc(locus: antares_client.search.Locus) -> pa.RecordBatch:
     """
     Format the lightcurve of a locus object from the ANTARES database.
 
@@ -20,43 +70,45 @@ def format_antares_lc(locus: antares_client.search.Locus) -> pd.DataFrame:
 
     Returns
     -------
-    lightcurve : pd.DataFrame
-        The formatted lightcurve.
+    lightcurve : pa.RecordBatch
+        The formatted lightcurve, with a ztf_object_id column to index by.
     """
 
-    # Select relevant columns
-    lc = locus.lightcurve[
-        ["ant_mjd", "ant_survey", "ant_passband", "ant_mag", "ant_magerr", "ant_maglim"]
-    ].copy()
-
-    # Fill NaN values in 'ant_mag' with 'ant_maglim'
-    lc["ant_mag"] = lc["ant_mag"].fillna(lc["ant_maglim"])
-
-    # Drop the 'ant_maglim' column
-    lc = lc.drop(columns=["ant_maglim"])
-
-    # Rename columns
-    lc = lc.rename(
-        columns={
-            "ant_mjd": "mjd",
-            "ant_survey": "non_detection",
-            "ant_passband": "band",
-            "ant_mag": "magnitude",
-            "ant_magerr": "magnitude_error",
-        }
+    if len(locus.lightcurve) == 0:
+        return _EMPTY_LC
+
+    # Read columns straight off the locus without copying; every output column below is a fresh
+    # array, so the locus lightcurve itself is never modified
+    lc = locus.lightcurve
+    ztf_id = locus.properties["ztf_object_id"]
+
+    mag = lc["ant_mag"].to_numpy(dtype=float, copy=False)
+    maglim = lc["ant_maglim"].to_numpy(dtype=float, copy=False)
+
+    # Factorize the handful of distinct passbands once and translate their codes with a lookup
+    # table; the trailing -1 keeps missing passbands (code -1) missing
+    passbands = pd.Categorical(lc["ant_passband"])
+    lookup = np.array([_BAND_CODES.get(p, -1) for p in passbands.categories] + [-1], dtype=np.int8)
+    band_codes = lookup.take(passbands.codes)
+
+    return pa.RecordBatch.from_pydict(
+        {
+            # Repeat the ID in Arrow rather than building a Python list of len(lc) strings
+            "ztf_object_id": pa.repeat(pa.scalar(ztf_id, pa.string()), len(lc)),
+            # ANTARES flags upper limits with survey == 2
+            "non_detection": lc["ant_survey"].to_numpy(copy=False) == 2,
+            "band": pa.DictionaryArray.from_arrays(
+                pa.array(band_codes, mask=band_codes < 0), _BAND_DICTIONARY
+            ),
+            # Magnitudes are only meaningful to ~1e-3, so float32 halves their size; mjd needs float64
+            "magnitude_error": lc["ant_magerr"].to_numpy(dtype=np.float32),
+            # Non-detections carry no magnitude, fall back to the limiting magnitude
+            "magnitude": np.where(np.isnan(mag), maglim, mag).astype(np.float32),
+            "mjd": lc["ant_mjd"].to_numpy(dtype=float, copy=False),
+        },
+        schema=_LC_SCHEMA,
     )
 
-    # Replace values in 'non_detection' and 'band' columns
-    lc["non_detection"] = lc["non_detection"].replace([1, 2], [False, True])
-    lc["band"] = lc["band"].replace(
-        ["g", "R", "r", "G", "i", "I"], ["ztfg", "ztfr", "ztfr", "ztfg", "ztfi", "ztfi"]
-    )
-
-    # Set index
-    lc.index = [locus.properties["ztf_object_id"]] * len(lc)
-
-    return lc
-
 
 def format_antares_meta(locus: antares_client.search.Locus):
     """
@@ -69,58 +121,135 @@ def format_antares_meta(locus: antares_client.search.Locus):
 
     Returns
     -------
-    meta : pd.DataFrame
-        The formatted metadata.
+    meta : dict
+        The formatted metadata, one record per locus.
     """
-    meta = pd.DataFrame(
-        [
-            {
-                key: locus.properties.get(key, None)
-                for key in [
-                    "ztf_object_id",
-                    "num_mag_values",
-                    "num_alerts",
-                    "brightest_alert_magnitude",
-                    "brightest_alert_observation_time",
-                    "newest_alert_magnitude",
-                    "newest_alert_observation_time",
-                    "oldest_alert_magnitude",
-                    "oldest_alert_observation_time",
-                    "survey",
-                ]
-            }
+    meta = {
+        key: locus.properties.get(key, None)
+        for key in [
+            "ztf_object_id",
+            "num_mag_values",
+            "num_alerts",
+            "brightest_alert_magnitude",
+            "brightest_alert_observation_time",
+            "newest_alert_magnitude",
+            "newest_alert_observation_time",
+            "oldest_alert_magnitude",
+            "oldest_alert_observation_time",
+            "survey",
         ]
-    )
+    }
 
     meta["ra"] = locus.ra
     meta["dec"] = locus.dec
 
-    meta.index = [locus.properties["ztf_object_id"]] * len(meta)
-
     return meta
 
 
-def query_ztf_lightcurve(ztf_object_id: str = None):
+def _cache_path(ztf_object_id: str) -> Path:
+    return _CACHE_DIR / _CACHE_VERSION / f"{ztf_object_id}.arrow"
+
+
+def _warn_cache_unavailable(error: Exception):
+    """Warn, once per session, that the disk cache is being bypassed."""
+    global _cache_warning_issued
+    if not _cache_warning_issued:
+        _cache_warning_issued = True
+        warnings.warn(f"ANTARES cache in {_CACHE_DIR} is unavailable, querying without it: {error}")
+
+
+def _read_cache(path: Path):
+    """
+    Read a cached lightcurve and its metadata.
+
+    Parameters
+    ----------
+    path : Path
+        The cache file written by `_write_cache`.
+
+    Returns
+    -------
+    lightcurve : pa.RecordBatch
+        The formatted lightcurve.
+    meta : dict
+        The formatted metadata.
+    """
+    with pa.OSFile(str(path), "rb") as source:
+        lightcurve = pa.ipc.open_file(source).get_batch(0)
+
+    meta = json.loads(lightcurve.schema.metadata[b"meta"])
+
+    return lightcurve.replace_schema_metadata(None), meta
+
+
+def _write_cache(path: Path, lightcurve: pa.RecordBatch, meta: dict):
+    """
+    Cache a formatted lightcurve, with its metadata stored in the schema metadata.
+
+    Parameters
+    ----------
+    path : Path
+        The cache file to write.
+    lightcurve : pa.RecordBatch
+        The formatted lightcurve.
+    meta : dict
+        The formatted metadata.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lightcurve = lightcurve.replace_schema_metadata({"meta": json.dumps(meta)})
+
+    # Write to a temporary file first so concurrent readers never see a partial entry
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as sink, pa.ipc.new_file(sink, lightcurve.schema) as writer:
+            writer.write_batch(lightcurve)
+        os.replace(tmp_path, path)
+    except Exception:
+        with suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+
+def query_ztf_lightcurve(ztf_object_id: str = None, refresh: bool = False):
     """
     Query the lightcurve of a ZTF object from the ANTARES database.
 
+    Results are cached on disk, so repeated queries for the same object skip the network. If the
+    cache can't be read or written, a warning is issued once and ANTARES is queried directly.
+
     Parameters
     ----------
     ztf_object_id : str
         The ZTF object ID.
+    refresh : bool
+        Whether to ignore any cached result and query ANTARES again.
 
     Returns
     -------
-    lightcurve : pd.DataFrame
+    lightcurve : pa.RecordBatch
         The formatted lightcurve.
-    meta : pd.DataFrame
+    meta : dict
         The formatted metadata.
     """
 
+    # The cache is best-effort: if it can't be read or written, fall back to querying ANTARES
+    cache_path = _cache_path(ztf_object_id)
+    if not refresh:
+        try:
+            if cache_path.exists():
+                return _read_cache(cache_path)
+        except (OSError, pa.ArrowInvalid) as error:
+            _warn_cache_unavailable(error)
+
     locus = get_by_ztf_object_id(ztf_object_id)
 
     lightcurve, meta = format_antares_lc(locus), format_antares_meta(locus)
 
+    try:
+        _write_cache(cache_path, lightcurve, meta)
+    except OSError as error:
+        _warn_cache_unavailable(error)
+
     return lightcurve, meta
 
 
@@ -148,6 +277,33 @@ def lcs_to_nested_df(lightcurves, meta):
     return nested_df
 
 
+def _to_parquet_by_layer(nested_df: NestedFrame, save_path: str):
+    """
+    Save a nested dataframe by layer, like `NestedFrame.to_parquet(by_layer=True)`.
+
+    The layers are written separately so the flat lightcurve layer can use larger row groups
+    than the per-object base layer.
+
+    Parameters
+    ----------
+    nested_df : NestedFrame
+        The nested dataframe.
+    save_path : str
+        The existing directory to write base.parquet and lightcurve.parquet to.
+    """
+    if not os.path.isdir(save_path):
+        raise ValueError("The provided path must be an existing directory if save_by_layer=True")
+
+    base_frame = nested_df.drop(columns=nested_df.nested_columns)
+    base_frame.to_parquet(os.path.join(save_path, "base.parquet"), **_PARQUET_WRITE_OPTIONS)
+
+    nested_df["lightcurve"].nest.to_flat().to_parquet(
+        os.path.join(save_path, "lightcurve.parquet"),
+        engine="pyarrow",
+        **{**_PARQUET_WRITE_OPTIONS, "row_group_size": _LC_LAYER_ROW_GROUP_SIZE},
+    )
+
+
 # def query_ztf_lightcurves(ztf_object_ids: list, save_path: str=None, save_by_layer: bool=True):
 #     lightcurves, metas = [], []
 
@@ -172,7 +328,12 @@ def lcs_to_nested_df(lightcurves, meta):
 
 
 def query_ztf_lightcurves(
-    ztf_object_ids: list, save_path: str = None, save_by_layer: bool = True, max_workers: int = 4
+    ztf_object_ids: list,
+    save_path: str = None,
+    save_by_layer: bool = True,
+    max_workers: int = 32,
+    refresh: bool = False,
+    warn_on_duplicates: bool = True,
 ):
     """
     Query the lightcurves of a list of ZTF objects from the ANTARES database.
@@ -186,7 +347,12 @@ def query_ztf_lightcurves(
     save_by_layer : bool
         Whether to save the nested dataframe by layer.
     max_workers : int
-        The maximum number of workers to use for multi-processing.
+        The maximum number of threads querying ANTARES concurrently. Each query is
+        almost entirely waiting on the network, so this can be well above the core count.
+    refresh : bool
+        Whether to ignore cached results and query ANTARES again for every object.
+    warn_on_duplicates : bool
+        Whether to warn when duplicate IDs are dropped from ztf_object_ids.
 
     Returns
     -------
@@ -194,13 +360,27 @@ def query_ztf_lightcurves(
         The nested dataframe.
     """
 
+    # Each object is only queried once, keeping the order of first appearance
+    unique_ids = list(dict.fromkeys(ztf_object_ids))
+    if warn_on_duplicates and len(unique_ids) < len(ztf_object_ids):
+        warnings.warn(f"Dropped {len(ztf_object_ids) - len(unique_ids)} duplicate ZTF object IDs")
+    ztf_object_ids = unique_ids
+
     lightcurves, metas = [], []
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
         future_to_id = {
-            executor.submit(query_ztf_lightcurve, ztf_object_id): ztf_object_id
+            executor.submit(query_ztf_lightcurve, ztf_object_id, refresh): ztf_object_id
             for ztf_object_id in ztf_object_ids
         }
-        for future in tqdm(as_completed(future_to_id), total=len(future_to_id)):
+        # Throttle progress updates; with a warm cache, futures complete far faster than tqdm redraws
+        for future in tqdm(
+            as_completed(future_to_id),
+            total=len(future_to_id),
+            mininterval=0.5,
+            miniters=max(1, len(future_to_id) // 200),
+        ):
+            # A finished future keeps its result alive, which would defeat self_destruct below
+            del future_to_id[future]
             try:
                 lightcurve, meta = future.result()
                 lightcurves.append(lightcurve)
@@ -208,9 +388,19 @@ def query_ztf_lightcurves(
             except Exception:
                 # print(f"Error processing {ztf_object_id}: {e}")
                 continue
-    lightcurves = pd.concat(lightcurves)
-    metas = pd.concat(metas)
+    table = pa.Table.from_batches(lightcurves, schema=_LC_SCHEMA)
+    # Drop our references to the batches so self_destruct can free each column as it is converted
+    lightcurves.clear()
+    # nested_pandas cannot read a dictionary back out of a nested column, so nest the band as strings
+    band = _LC_SCHEMA.get_field_index("band")
+    table = table.set_column(band, "band", table.column(band).cast(pa.string()))
+    # One Arrow -> pandas conversion for all loci instead of concatenating per-locus frames
+    lightcurves = table.to_pandas(self_destruct=True, split_blocks=True).set_index("ztf_object_id")
+    del table
+    metas = pd.DataFrame.from_records(metas, index=[meta["ztf_object_id"] for meta in metas])
     nested_df = lcs_to_nested_df(lightcurves, metas).reset_index(drop=True)
-    if save_path is not None:
-        nested_df.to_parquet(save_path, by_layer=save_by_layer)
+    if save_path is not None and save_by_layer:
+        _to_parquet_by_layer(nested_df, save_path)
+    elif save_path is not None:
+        nested_df.to_parquet(save_path, **_PARQUET_WRITE_OPTIONS)
     return nested_df
@@ -1,4 +1,5 @@
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 from matplotlib import rcParams
 
@@ -51,33 +52,45 @@ def plot_light_curve(
         fig, ax = plt.subplots(1, 1, figsize=(10, 8))
 
     if time_axis != "mjd":
-        lightcurve["mjd"] = lightcurve["mjd"] - lightcurve[lightcurve["non_detection"] == False]["mjd"].min()
-
-    for band in lightcurve["band"].unique():
-        band_data = lightcurve[lightcurve["band"] == band]
-
-        detections = band_data[band_data["non_detection"] == False]
-        non_detections = band_data[band_data["non_detection"] == True]
-
-        ax.errorbar(
-            detections["mjd"],
-            detections["magnitude"],
-            detections["magnitude_error"],
-            fmt=marker_dict[band],
-            label=band,
-            **kwargs,
-            color=color_dict[band],
-            markersize=8,
-            mec="black",
-        )
-        ax.scatter(
-            non_detections["mjd"],
-            non_detections["magnitude"],
-            marker="v",
-            color=color_dict[band],
-            s=50,
-            edgecolors="black",
-        )
+        mjd = lightcurve["mjd"].to_numpy(dtype=float)
+        # Missing flags (nullable columns from the nested layer) are treated as non-detections
+        detected = ~lightcurve["non_detection"].to_numpy(dtype=bool, na_value=True)
+        # Without any detection there is no reference time, so the axis becomes NaN as before
+        t0 = mjd[detected].min() if detected.any() else np.nan
+        # Shift on a new frame rather than overwriting the caller's mjd column
+        lightcurve = lightcurve.assign(mjd=mjd - t0)
+
+    groups = list(lightcurve.groupby(["band", "non_detection"], sort=False))
+    # Bands with only upper limits get their legend entry from the scatter instead
+    detected_bands = {band for (band, non_detection), _ in groups if not non_detection}
+
+    for (band, non_detection), group in groups:
+        if non_detection:
+            ax.scatter(
+                group["mjd"],
+                group["magnitude"],
+                marker="v",
+                label=None if band in detected_bands else band,
+                color=color_dict[band],
+                s=50,
+                edgecolors="black",
+                rasterized=True,
+            )
+        else:
+            errorbar = ax.errorbar(
+                group["mjd"],
+                group["magnitude"],
+                group["magnitude_error"],
+                fmt=marker_dict[band],
+                label=band,
+                **kwargs,
+                color=color_dict[band],
+                markersize=8,
+                mec="black",
+            )
+            # Rasterize the points, caps and bars; axes, ticks and labels stay vector
+            for artist in errorbar.get_children():
+                artist.set_rasterized(True)
 
     ax.minorticks_on()
     ax.tick_params(which="both", direction="in", top=True, right=True)
@@ -96,3 +109,36 @@ def plot_light_curve(
         return "none"
     else:
         return ax
+
+
+def plot_light_curves(nested_df, save_path: str, time_axis: str = "mjd", **kwargs):
+    """
+    Plot and save the light curve of every object in a nested dataframe.
+
+    A single figure is reused for all objects, so the figure and its canvas are only allocated once.
+    Objects without any photometry are skipped.
+
+    Parameters
+    ----------
+    nested_df : NestedFrame
+        The nested dataframe, as returned by `query_ztf_lightcurves`.
+    save_path : str
+        The path to save the plots.
+    time_axis : str
+        The time axis to use. Options are "mjd" or "relative"
+    kwargs : dict
+        Additional keyword arguments to pass to `plot_light_curve`
+    """
+
+    fig, ax = plt.subplots(1, 1, figsize=(10, 8))
+
+    for ztf_id, lightcurve in zip(nested_df["ztf_object_id"], nested_df["lightcurve"]):
+        # Objects without photometry come back from the nested layer as None
+        if lightcurve is None:
+            continue
+
+        ax.cla()
+        plot_light_curve(lightcurve, ztf_id, ax=ax, time_axis=time_axis, **kwargs)
+        fig.savefig(save_path + ztf_id + ".png", dpi=300)
+
+    plt.close(fig)
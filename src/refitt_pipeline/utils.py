@@ -1,3 +1,8 @@
+import pandas as pd
+
 color_dict = {"ztfg": "green", "ztfr": "red", "ztfi": "brown"}
 
 marker_dict = {"ztfg": "o", "ztfr": "o", "ztfi": "o"}
+
+# Fixed band vocabulary so lightcurves from different loci share one categorical dtype
+band_dtype = pd.CategoricalDtype(["ztfg", "ztfr", "ztfi"])
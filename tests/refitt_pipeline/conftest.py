@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from refitt_pipeline.facilities import ztf
+
+
+def make_locus(ztf_object_id: str, n: int, seed: int) -> SimpleNamespace:
+    """Build a fake ANTARES locus with `n` rows of photometry"""
+    rng = np.random.default_rng(seed)
+    survey = rng.choice([1, 2], n)
+    mag = rng.uniform(17, 20, n)
+    mag[survey == 2] = np.nan
+    lightcurve = pd.DataFrame(
+        {
+            "ant_mjd": np.sort(rng.uniform(58000, 58100, n)),
+            "ant_survey": survey,
+            "ant_passband": rng.choice(list("gRrGiI"), n),
+            "ant_mag": mag,
+            "ant_magerr": np.where(survey == 2, np.nan, rng.uniform(0.01, 0.2, n)),
+            "ant_maglim": rng.uniform(19, 21, n),
+        }
+    )
+    properties = {"ztf_object_id": ztf_object_id, "num_mag_values": n, "num_alerts": n, "survey": "ztf"}
+    return SimpleNamespace(lightcurve=lightcurve, properties=properties, ra=10.0 + seed, dec=-5.0 - seed)
+
+
+@pytest.fixture
+def fake_antares(monkeypatch, tmp_path):
+    """Serve fake loci instead of querying ANTARES and cache them in a temporary directory"""
+    loci = {f"ZTF{i}": make_locus(f"ZTF{i}", 4 + 3 * i, i) for i in range(4)}
+    loci["ZTFEMPTY"] = make_locus("ZTFEMPTY", 0, 99)
+    calls = []
+
+    def get_by_ztf_object_id(ztf_object_id):
+        calls.append(ztf_object_id)
+        return loci[ztf_object_id]
+
+    monkeypatch.setattr(ztf, "get_by_ztf_object_id", get_by_ztf_object_id)
+    monkeypatch.setattr(ztf, "_CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(ztf, "_cache_warning_issued", False)
+
+    return SimpleNamespace(loci=loci, calls=calls, cache_dir=tmp_path / "cache", make_locus=make_locus)
@@ -0,0 +1,66 @@
+import matplotlib
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from nested_pandas import NestedFrame
+
+from refitt_pipeline import plotting
+
+matplotlib.use("Agg")
+
+
+def make_lightcurve(non_detection, dtype=bool) -> pd.DataFrame:
+    """Build a formatted lightcurve with the given non-detection flags"""
+    n = len(non_detection)
+    return pd.DataFrame(
+        {
+            "non_detection": pd.Series(non_detection, dtype=dtype),
+            "band": ["ztfg", "ztfr"] * (n // 2) + ["ztfg"] * (n % 2),
+            "magnitude_error": np.full(n, 0.1),
+            "magnitude": np.linspace(18, 19, n),
+            "mjd": np.linspace(58000, 58010, n),
+        }
+    )
+
+
+def test_plot_light_curve_relative_without_detections() -> None:
+    """Verify a relative time axis works for lightcurves with only upper limits or no rows"""
+    for lightcurve in [make_lightcurve([True, True, True]), make_lightcurve([])]:
+        before = lightcurve.copy()
+        ax = plotting.plot_light_curve(lightcurve, "ZTF", time_axis="relative")
+        assert ax is not None
+        assert lightcurve.equals(before)
+        plt.close("all")
+
+
+def test_plot_light_curve_relative_nullable_flags() -> None:
+    """Verify a relative time axis works when the nested layer returns missing flags"""
+    lightcurve = make_lightcurve([False, None, True, False], dtype=pd.ArrowDtype(pa.bool_()))
+    ax = plotting.plot_light_curve(lightcurve, "ZTF", time_axis="relative")
+    offsets = np.concatenate([line.get_xdata() for line in ax.get_lines()])
+    assert np.nanmin(offsets) == 0
+    plt.close("all")
+
+
+def test_plot_light_curve_legend_upper_limit_only_band() -> None:
+    """Verify bands with only upper limits still get a legend entry"""
+    lightcurve = make_lightcurve([False, True, False, True])
+    lightcurve["band"] = ["ztfg", "ztfr", "ztfg", "ztfr"]
+    ax = plotting.plot_light_curve(lightcurve, "ZTF")
+    labels = [text.get_text() for text in ax.get_legend().get_texts()]
+    assert sorted(labels) == ["ztfg", "ztfr"]
+    plt.close("all")
+
+
+def test_plot_light_curves_skips_empty_lightcurves(tmp_path) -> None:
+    """Verify objects without photometry are skipped when plotting a nested dataframe"""
+    meta = pd.DataFrame({"ztf_object_id": ["ZTF1", "ZTF2"]}, index=[0, 1])
+    lightcurves = make_lightcurve([False, True, False]).set_index(pd.Index([0, 0, 0]))
+    nested_df = NestedFrame(meta).add_nested(lightcurves, "lightcurve")
+    assert nested_df["lightcurve"].iloc[1] is None
+
+    plotting.plot_light_curves(nested_df, str(tmp_path) + "/")
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["ZTF1.png"]
+    assert not plt.get_fignums()
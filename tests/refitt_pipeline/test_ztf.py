@@ -0,0 +1,151 @@
+from types import SimpleNamespace
+
+import nested_pandas
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from refitt_pipeline.facilities import ztf
+from refitt_pipeline.utils import band_dtype
+
+
+def make_handwritten_locus() -> SimpleNamespace:
+    """Build a small locus covering every passband, survey and missing magnitude case"""
+    lightcurve = pd.DataFrame(
+        {
+            "ant_mjd": [58000.0, 58001.0, 58002.0, 58003.0, 58004.0],
+            "ant_survey": [1, 2, 1, 2, 1],
+            "ant_passband": ["g", "R", "i", "u", None],
+            "ant_mag": np.array([18.5, np.nan, 19.25, np.nan, 17.75], dtype=np.float32),
+            "ant_magerr": np.array([0.0625, np.nan, 0.125, np.nan, 0.25], dtype=np.float32),
+            "ant_maglim": np.array([20.0, 20.5, 21.0, 19.5, 20.25], dtype=np.float32),
+        }
+    )
+    return SimpleNamespace(lightcurve=lightcurve, properties={"ztf_object_id": "ZTFHAND"}, ra=1.0, dec=2.0)
+
+
+def test_format_antares_lc() -> None:
+    """Verify passbands, upper limits and the limiting magnitude fallback of a hand-written locus"""
+    lightcurve = ztf.format_antares_lc(make_handwritten_locus())
+
+    expected = pd.DataFrame(
+        {
+            "ztf_object_id": ["ZTFHAND"] * 5,
+            "non_detection": [False, True, False, True, False],
+            "band": pd.Categorical(["ztfg", "ztfr", "ztfi", None, None], dtype=band_dtype),
+            "magnitude_error": np.array([0.0625, np.nan, 0.125, np.nan, 0.25], dtype=np.float32),
+            "magnitude": np.array([18.5, 20.5, 19.25, 19.5, 17.75], dtype=np.float32),
+            "mjd": [58000.0, 58001.0, 58002.0, 58003.0, 58004.0],
+        }
+    )
+    assert lightcurve.schema.equals(ztf._LC_SCHEMA)
+    pd.testing.assert_frame_equal(lightcurve.to_pandas(), expected)
+
+    empty_locus = make_handwritten_locus()
+    empty_locus.lightcurve = empty_locus.lightcurve.iloc[:0]
+    assert ztf.format_antares_lc(empty_locus) is ztf._EMPTY_LC
+
+
+def test_query_ztf_lightcurves_saved_bands(fake_antares, tmp_path) -> None:
+    """Verify the saved nested dataframe reads back with its bands"""
+    fake_antares.loci["ZTFHAND"] = make_handwritten_locus()
+    save_path = tmp_path / "lightcurves.parquet"
+
+    ztf.query_ztf_lightcurves(["ZTFHAND"], save_path=str(save_path), save_by_layer=False)
+    nested_df = nested_pandas.read_parquet(str(save_path))
+
+    assert nested_df["lightcurve"].nest.to_flat()["band"].tolist()[:3] == ["ztfg", "ztfr", "ztfi"]
+
+
+def test_query_ztf_lightcurve_cache(fake_antares) -> None:
+    """Verify a cached query returns the same result without hitting ANTARES"""
+    lightcurve, meta = ztf.query_ztf_lightcurve("ZTF1")
+    cached_lightcurve, cached_meta = ztf.query_ztf_lightcurve("ZTF1")
+
+    assert fake_antares.calls == ["ZTF1"]
+    assert cached_lightcurve.to_pandas().equals(lightcurve.to_pandas())
+    assert cached_lightcurve.schema.equals(ztf._LC_SCHEMA)
+    assert cached_meta == meta
+
+    ztf.query_ztf_lightcurve("ZTF1", refresh=True)
+    assert fake_antares.calls == ["ZTF1", "ZTF1"]
+
+
+def test_query_ztf_lightcurve_unwritable_cache(fake_antares, monkeypatch, tmp_path) -> None:
+    """Verify an unusable cache directory warns once and still returns results"""
+    blocker = tmp_path / "not_a_directory"
+    blocker.write_text("")
+    monkeypatch.setattr(ztf, "_CACHE_DIR", blocker / "cache")
+
+    with pytest.warns(UserWarning, match="cache") as record:
+        nested_df = ztf.query_ztf_lightcurves(["ZTF0", "ZTF1", "ZTF2"], max_workers=1)
+
+    assert len(record) == 1
+    assert sorted(nested_df["ztf_object_id"]) == ["ZTF0", "ZTF1", "ZTF2"]
+
+
+def test_write_cache_removes_partial_file(fake_antares, monkeypatch) -> None:
+    """Verify a failed cache write leaves no temporary file behind"""
+
+    def new_file(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(pa.ipc, "new_file", new_file)
+
+    with pytest.warns(UserWarning, match="disk full"):
+        lightcurve, _ = ztf.query_ztf_lightcurve("ZTF0")
+
+    assert lightcurve.num_rows == len(fake_antares.loci["ZTF0"].lightcurve)
+    assert not [path for path in fake_antares.cache_dir.rglob("*") if path.is_file()]
+
+
+def test_query_ztf_lightcurves_row_groups(fake_antares, tmp_path) -> None:
+    """Verify per-object files use small row groups and the flat lightcurve layer large ones"""
+    for i in range(4, 70):
+        fake_antares.loci[f"ZTF{i}"] = fake_antares.make_locus(f"ZTF{i}", 3, i)
+    ids = sorted(fake_antares.loci)
+
+    single_path = tmp_path / "single.parquet"
+    ztf.query_ztf_lightcurves(ids, save_path=str(single_path), save_by_layer=False)
+    assert pq.ParquetFile(single_path).metadata.num_row_groups == 2
+
+    ztf.query_ztf_lightcurves(ids, save_path=str(tmp_path))
+    assert pq.ParquetFile(tmp_path / "base.parquet").metadata.num_row_groups == 2
+    assert pq.ParquetFile(tmp_path / "lightcurve.parquet").metadata.num_row_groups == 1
+
+
+def test_query_ztf_lightcurves_by_layer(fake_antares, tmp_path) -> None:
+    """Verify the by-layer output matches NestedFrame.to_parquet(by_layer=True)"""
+    layer_path, reference_path = tmp_path / "layers", tmp_path / "reference"
+    layer_path.mkdir()
+    reference_path.mkdir()
+
+    nested_df = ztf.query_ztf_lightcurves(sorted(fake_antares.loci), save_path=str(layer_path))
+    nested_df.to_parquet(str(reference_path), by_layer=True)
+
+    for layer in ["base", "lightcurve"]:
+        written = pq.read_table(layer_path / f"{layer}.parquet")
+        reference = pq.read_table(reference_path / f"{layer}.parquet")
+        assert written.schema.equals(reference.schema, check_metadata=True)
+        assert written.to_pandas().equals(reference.to_pandas())
+    assert pq.read_schema(layer_path / "lightcurve.parquet").names[:5] == [
+        "non_detection",
+        "band",
+        "magnitude_error",
+        "magnitude",
+        "mjd",
+    ]
+
+    with pytest.raises(ValueError, match="existing directory"):
+        ztf.query_ztf_lightcurves(["ZTF0"], save_path=str(tmp_path / "missing"))
+
+
+def test_query_ztf_lightcurves_deduplicates(fake_antares) -> None:
+    """Verify duplicate IDs are queried once and warned about"""
+    with pytest.warns(UserWarning, match="Dropped 2 duplicate"):
+        nested_df = ztf.query_ztf_lightcurves(["ZTF0", "ZTF1", "ZTF0", "ZTF1"], max_workers=1)
+
+    assert sorted(fake_antares.calls) == ["ZTF0", "ZTF1"]
+    assert sorted(nested_df["ztf_object_id"]) == ["ZTF0", "ZTF1"]